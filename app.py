@@ -1,9 +1,13 @@
+import hashlib
 import html
 import os
 import random
+import re
+import shutil
 import sqlite3
 import threading
 import time
+import unicodedata
 import uuid
 import zlib
 from collections import Counter, defaultdict
@@ -16,6 +20,9 @@ import qrcode
 import streamlit as st
 from wordcloud import WordCloud
 
+from content_filter import ContentFilter, parse_terms
+from export_results import export_session, responses_db_path
+
 # Configuração da página
 st.set_page_config(
     page_title="App Live",
@@ -153,11 +160,31 @@ def inject_custom_css():
 inject_custom_css()
 
 # Configuração do banco de dados com thread lock
+DB_PATH = 'app_live.db'
+
+# Modo de armazenamento (variável de ambiente APP_LIVE_STORAGE):
+# - "single" (padrão): tudo em app_live.db, uma conexão e um lock globais;
+# - "sharded": app_live.db vira só o catálogo (sessões, PINs, config) e as
+#   respostas de cada sessão vão para um arquivo próprio em SHARD_DIR, com
+#   conexão e lock próprios — uma rajada de respostas numa sala não trava
+#   as outras.
+# Trocar de modo não migra dados: sessões abertas antes da troca ficam sem
+# as respostas já gravadas no outro formato.
+STORAGE_MODES = ("single", "sharded")
+STORAGE_MODE = os.environ.get("APP_LIVE_STORAGE", "single").strip().lower()
+SHARD_DIR = os.environ.get("APP_LIVE_SHARD_DIR", "app_live_shards")
+SHARD_IDLE_SECONDS = 300  # shard sem uso por esse tempo tem a conexão fechada
+
+if STORAGE_MODE not in STORAGE_MODES:
+    # Valor desconhecido (ex.: "shard") não pode cair em silêncio no modo single
+    st.error(f"APP_LIVE_STORAGE inválido: {STORAGE_MODE!r}. Use 'single' ou 'sharded'.")
+    st.stop()
+
 db_lock = threading.Lock()
 
-@st.cache_resource
-def get_db_connection():
-    conn = sqlite3.connect('app_live.db', check_same_thread=False, timeout=30)
+
+def _open_connection(path):
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
     # WAL reduz contenção entre leituras e escritas concorrentes
     conn.execute("PRAGMA journal_mode=WAL;")
     conn.execute("PRAGMA busy_timeout=30000;")
@@ -165,15 +192,155 @@ def get_db_connection():
     return conn
 
 
-def run_db(operation, max_attempts=4, base_delay=0.1, max_delay=2.0):
+def _ensure_hidden_column(conn):
+    """Bancos anteriores ao filtro de conteúdo não têm responses.hidden."""
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(responses)")]
+    if "hidden" not in columns:
+        conn.execute("ALTER TABLE responses ADD COLUMN hidden INTEGER NOT NULL DEFAULT 0")
+
+
+@st.cache_resource
+def get_db_connection():
+    return _open_connection(DB_PATH)
+
+
+class _Shard:
+    """Conexão e lock de um shard. `closed` marca conexão fechada (ociosa ou
+    sessão encerrada); é lido sempre com o lock do shard na mão."""
+
+    def __init__(self, conn, now):
+        self.conn = conn
+        self.lock = threading.Lock()
+        self.last_used = now
+        self.closed = False
+        self.dropped = False
+
+
+class ShardPool:
+    """Conexões dos shards (um arquivo SQLite por sessão), abertas sob demanda.
+
+    Cada shard tem conexão e lock próprios; o lock do pool protege só o
+    dicionário, nunca uma consulta. Conexões ociosas há mais de
+    `idle_seconds` são fechadas oportunisticamente a cada acquire.
+    """
+
+    def __init__(self, directory, idle_seconds=SHARD_IDLE_SECONDS):
+        self.directory = directory
+        self.idle_seconds = idle_seconds
+        self._lock = threading.Lock()
+        self._shards = {}      # session_id -> _Shard
+        self._dropped = set()  # sessões encerradas: nunca mais ganham shard
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, session_id):
+        # uuid.UUID valida o id: nada de caminhos arbitrários no nome do arquivo
+        return os.path.join(self.directory, f"{uuid.UUID(session_id)}.db")
+
+    def acquire(self, session_id, create=None):
+        """Retorna o _Shard da sessão, abrindo se preciso, ou None.
+
+        Só escritas criam o arquivo: `create` é um predicado chamado quando o
+        shard ainda não existe e que confirma que a sessão segue no catálogo.
+        Leituras de sessão sem respostas ou encerrada devolvem None, em vez
+        de deixar para trás um shard órfão.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if session_id in self._dropped:
+                return None
+            shard = self._shards.get(session_id)
+            if shard is None:
+                path = self.path(session_id)
+                if not os.path.exists(path) and (create is None or not create()):
+                    return None
+                conn = _open_connection(path)
+                conn.execute('''CREATE TABLE IF NOT EXISTS responses
+                                (id TEXT PRIMARY KEY, session_id TEXT, response TEXT, created_at TIMESTAMP,
+                                 hidden INTEGER NOT NULL DEFAULT 0)''')
+                _ensure_hidden_column(conn)
+                conn.execute('''CREATE TABLE IF NOT EXISTS token_counts
+                                (session_id TEXT, token TEXT, count INTEGER NOT NULL,
+                                 PRIMARY KEY(session_id, token))''')
+                conn.commit()
+                shard = _Shard(conn, now)
+                self._shards[session_id] = shard
+            shard.last_used = now
+            self._close_idle(now)
+        return shard
+
+    def _close_idle(self, now):
+        for session_id, shard in list(self._shards.items()):
+            # Shard em uso (lock ocupado) fica para a próxima varredura
+            if now - shard.last_used > self.idle_seconds and shard.lock.acquire(blocking=False):
+                try:
+                    shard.conn.close()
+                    shard.closed = True
+                    del self._shards[session_id]
+                finally:
+                    shard.lock.release()
+
+    def drop(self, session_id):
+        """Fecha o shard e apaga o arquivo — encerrar a sessão vira um unlink."""
+        with self._lock:
+            self._dropped.add(session_id)
+            shard = self._shards.pop(session_id, None)
+        if shard is not None:
+            with shard.lock:
+                shard.conn.close()
+                shard.closed = shard.dropped = True
+        path = self.path(session_id)
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.remove(path + suffix)
+            except FileNotFoundError:
+                pass
+
+
+@st.cache_resource
+def get_shard_pool():
+    return ShardPool(SHARD_DIR)
+
+
+def _session_in_catalog(session_id):
+    def op(conn):
+        c = conn.cursor()
+        c.execute("SELECT 1 FROM sessions WHERE id = ?", (session_id,))
+        return c.fetchone() is not None
+
+    return run_db(op)
+
+
+def _run_on_shard(operation, session_id, create_shard, missing):
+    while True:
+        shard = get_shard_pool().acquire(
+            session_id, create=(lambda: _session_in_catalog(session_id)) if create_shard else None)
+        if shard is None:
+            return missing
+        with shard.lock:
+            if shard.dropped:  # end_session venceu a corrida
+                return missing
+            if not shard.closed:
+                return operation(shard.conn)
+        # Fechado por ociosidade entre o acquire e o lock: reabre
+
+
+def run_db(operation, session_id=None, create_shard=False, missing=None,
+           max_attempts=4, base_delay=0.1, max_delay=2.0):
     """Executa uma operação no banco com retry e backoff exponencial com jitter.
 
+    Com `session_id` no modo "sharded", a operação roda no shard da sessão
+    (respostas e contadores); sem ele, no catálogo/banco principal. Só
+    `create_shard=True` cria um shard inexistente, e apenas para sessão
+    ainda presente no catálogo; sem shard (ou com a sessão encerrada no
+    meio do caminho), a operação não roda e o resultado é `missing`.
     Retenta apenas sqlite3.OperationalError (ex.: 'database is locked');
     erros de programação/integridade propagam imediatamente.
     """
     delay = base_delay
     for attempt in range(1, max_attempts + 1):
         try:
+            if session_id is not None and STORAGE_MODE == "sharded":
+                return _run_on_shard(operation, session_id, create_shard, missing)
             with db_lock:
                 return operation(get_db_connection())
         except sqlite3.OperationalError:
@@ -183,17 +350,95 @@ def run_db(operation, max_attempts=4, base_delay=0.1, max_delay=2.0):
             delay = min(delay * 2, max_delay)
 
 
+# Stopwords para o modo "palavras": artigos, preposições, pronomes e verbos
+# auxiliares que dominariam a nuvem sem dizer nada sobre as respostas.
+# Guardadas sem acento, já que os tokens são comparados sem acento — por
+# isso "sao" fica de fora: derrubaria o "São" de "São Paulo".
+STOPWORDS_PT = frozenset("""
+    a ao aos aquela aquelas aquele aqueles aquilo as ate com como da das de dela
+    delas dele deles depois do dos e ela elas ele eles em entre era eram essa
+    essas esse esses esta estao estas estava este estes eu foi foram ha isso
+    isto ja la lhe lhes mais mas me mesmo meu meus minha minhas muito muita
+    muitos muitas na nas nao nem no nos nossa nossas nosso nossos num numa o os
+    ou para pela pelas pelo pelos por pra pro qual quando que quem se sem ser
+    seu seus sua suas so tambem te tem tinha to tu tua tuas um uma umas uns
+    voce voces vos eh sera estar ter vai vou
+""".split())
+
+STOPWORDS_EN = frozenset("""
+    a about after all also am an and any are as at be because been but by can
+    could did do does for from had has have he her him his how i if in into is
+    it its just me more my no not of on or our out she so some than that the
+    their them then there these they this to too up us was we were what when
+    which who will with would you your
+""".split())
+
+STOPWORDS = STOPWORDS_PT | STOPWORDS_EN
+
+# Sequências de letras (com hífen/apóstrofo internos: "bem-vindo", "don't")
+# ou números; pontuação e emojis separam tokens
+_TOKEN_RE = re.compile(r"[^\W_]+(?:['’-][^\W_]+)*")
+
+
+def _strip_accents(text):
+    return "".join(ch for ch in unicodedata.normalize("NFD", text)
+                   if unicodedata.category(ch) != "Mn")
+
+
+def tokenize_response(response):
+    """Tokens distintos de uma resposta para o modo "palavras".
+
+    Cada resposta vota no máximo uma vez por palavra (como no modo frases,
+    onde cada resposta conta uma vez), então repetir "bom bom bom" não infla
+    a contagem. Tokens vão em maiúsculas, como as frases na nuvem.
+    """
+    tokens = set()
+    for token in _TOKEN_RE.findall(response.lower()):
+        # Letra solta não diz nada; dígito solto sim (notas de 1 a 5)
+        if (len(token) < 2 and not token.isdigit()) or _strip_accents(token) in STOPWORDS:
+            continue
+        tokens.add(token.upper())
+    return tokens
+
+
+def _increment_token_counts(cursor, session_id, response):
+    """Soma os tokens de uma resposta aos contadores da sessão (UPSERT)."""
+    cursor.executemany(
+        "INSERT INTO token_counts (session_id, token, count) VALUES (?, ?, 1) "
+        "ON CONFLICT(session_id, token) DO UPDATE SET count = count + 1",
+        [(session_id, token) for token in tokenize_response(response)])
+
+
 def init_db():
     def op(conn):
         c = conn.cursor()
         c.execute('''CREATE TABLE IF NOT EXISTS sessions
-                     (id TEXT PRIMARY KEY, pin TEXT UNIQUE, question TEXT, created_at TIMESTAMP)''')
+                     (id TEXT PRIMARY KEY, pin TEXT UNIQUE, question TEXT, created_at TIMESTAMP,
+                      analysis_mode TEXT NOT NULL DEFAULT 'phrases')''')
+        # Modo de análise (frases/palavras) por sessão: vale para moderador e participantes
+        if "analysis_mode" not in [row[1] for row in c.execute("PRAGMA table_info(sessions)")]:
+            c.execute("ALTER TABLE sessions ADD COLUMN analysis_mode TEXT NOT NULL DEFAULT 'phrases'")
         c.execute('''CREATE TABLE IF NOT EXISTS responses
                      (id TEXT PRIMARY KEY, session_id TEXT, response TEXT, created_at TIMESTAMP,
+                      hidden INTEGER NOT NULL DEFAULT 0,
                       FOREIGN KEY(session_id) REFERENCES sessions(id))''')
+        _ensure_hidden_column(conn)
         c.execute('''CREATE TABLE IF NOT EXISTS config
                      (key TEXT PRIMARY KEY, value TEXT)''')
 
+        # Contadores de palavras por sessão, mantidos incrementalmente pelo
+        # add_response. Bancos antigos não têm a tabela: reconstrói uma vez
+        # a partir das respostas já gravadas.
+        c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'token_counts'")
+        needs_backfill = c.fetchone() is None
+        c.execute('''CREATE TABLE IF NOT EXISTS token_counts
+                     (session_id TEXT, token TEXT, count INTEGER NOT NULL,
+                      PRIMARY KEY(session_id, token))''')
+        if needs_backfill:
+            c.execute("SELECT session_id, response FROM responses WHERE hidden = 0")
+            for session_id, response in c.fetchall():
+                _increment_token_counts(c, session_id, response or "")
+
         # Inserir senha padrão se não existir
         c.execute("SELECT value FROM config WHERE key = 'moderator_password'")
         if not c.fetchone():
@@ -234,7 +479,62 @@ def update_moderator_password(new_password):
         st.error(f"Erro ao atualizar senha: {e}")
         return False
 
+# Filtro de conteúdo: termos guardados na tabela config, um por linha
+CONTENT_FILTER_ACTIONS = {"hide": "🙈 Ocultar (grava, mas não exibe)", "reject": "⛔ Rejeitar"}
+
+
+def _read_content_filter_settings():
+    """(blocklist, allowlist, ação) como texto cru da tabela config."""
+    def op(conn):
+        c = conn.cursor()
+        c.execute("SELECT key, value FROM config WHERE key IN "
+                  "('filter_blocklist', 'filter_allowlist', 'filter_action')")
+        return dict(c.fetchall())
+
+    config = run_db(op)
+    return (config.get("filter_blocklist", ""), config.get("filter_allowlist", ""),
+            config.get("filter_action", "hide"))
+
+
+@st.cache_resource(show_spinner=False)
+def get_content_filter():
+    """Autômato do filtro (compilado uma vez e compartilhado) e a ação configurada.
+
+    Erros de banco propagam — cache_resource não guarda exceções, então a
+    próxima chamada tenta de novo em vez de fixar um filtro vazio.
+    """
+    blocklist, allowlist, action = _read_content_filter_settings()
+    return ContentFilter(parse_terms(blocklist), parse_terms(allowlist)), action
+
+
+def get_content_filter_settings():
+    try:
+        return _read_content_filter_settings()
+    except Exception as e:
+        st.error(f"Erro ao carregar filtro de conteúdo: {e}")
+        return "", "", "hide"
+
+
+def update_content_filter(blocklist, allowlist, action):
+    def op(conn):
+        c = conn.cursor()
+        c.executemany("INSERT INTO config (key, value) VALUES (?, ?) "
+                      "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                      [("filter_blocklist", blocklist), ("filter_allowlist", allowlist),
+                       ("filter_action", action)])
+        conn.commit()
+
+    try:
+        run_db(op)
+        get_content_filter.clear()  # write-invalidate: recompila na próxima resposta
+        return True
+    except Exception as e:
+        st.error(f"Erro ao salvar filtro de conteúdo: {e}")
+        return False
+
+@st.cache_data(max_entries=64, show_spinner=False)
 def generate_qr_code(url):
+    """QR Code do link como PNG (bytes) — cacheado: a URL não muda durante a sessão."""
     try:
         qr = qrcode.QRCode(
             version=1,
@@ -248,8 +548,7 @@ def generate_qr_code(url):
         img = qr.make_image(fill_color="black", back_color="white")
         buf = BytesIO()
         img.save(buf, format='PNG')
-        buf.seek(0)
-        return buf
+        return buf.getvalue()
     except Exception as e:
         st.error(f"Erro ao gerar QR Code: {e}")
         return None
@@ -285,7 +584,7 @@ def create_session(question):
 def get_session_by_pin(pin):
     def op(conn):
         c = conn.cursor()
-        c.execute("SELECT id, pin, question, created_at FROM sessions WHERE pin = ?", (pin,))
+        c.execute("SELECT id, pin, question, created_at, analysis_mode FROM sessions WHERE pin = ?", (pin,))
         return c.fetchone()
 
     try:
@@ -294,16 +593,64 @@ def get_session_by_pin(pin):
         st.error(f"Erro ao buscar sessão: {e}")
         return None
 
-def add_response(session_id, response):
+ANALYSIS_MODES = {"phrases": "Frases", "words": "Palavras"}
+
+
+def update_analysis_mode(session_id, mode):
     def op(conn):
         c = conn.cursor()
-        c.execute("INSERT INTO responses (id, session_id, response, created_at) VALUES (?, ?, ?, ?)",
-                  (str(uuid.uuid4()), session_id, response.strip(), datetime.now()))
+        c.execute("UPDATE sessions SET analysis_mode = ? WHERE id = ?", (mode, session_id))
         conn.commit()
 
     try:
         run_db(op)
-        get_responses.clear(session_id)  # write-invalidate apenas desta sessão
+        get_session_by_pin.clear()  # write-invalidate: participantes passam a ver o novo modo
+        return True
+    except Exception as e:
+        st.error(f"Erro ao atualizar modo de análise: {e}")
+        return False
+
+
+def session_cloud_counts(session_data, responses):
+    """Contagens da nuvem conforme o modo de análise gravado na sessão."""
+    if session_data[4] == "words":
+        return get_token_counts(session_data[0])
+    return phrase_counts(responses)
+
+
+class ResponseRejected(Exception):
+    """Resposta barrada pelo filtro de conteúdo no modo "rejeitar"."""
+
+
+def add_response(session_id, response):
+    """Grava a resposta; levanta ResponseRejected se o filtro a rejeitar.
+
+    O filtro roda uma única vez aqui: respostas ocultadas ficam gravadas com
+    hidden = 1 e fora dos contadores, então as leituras não filtram nada.
+    """
+    try:
+        content_filter, action = get_content_filter()
+    except Exception as e:
+        st.error(f"Erro ao carregar filtro de conteúdo: {e}")
+        return False
+    hidden = content_filter.is_blocked(response)
+    if hidden and action == "reject":
+        raise ResponseRejected(response)
+
+    def op(conn):
+        c = conn.cursor()
+        c.execute("INSERT INTO responses (id, session_id, response, created_at, hidden) VALUES (?, ?, ?, ?, ?)",
+                  (str(uuid.uuid4()), session_id, response.strip(), datetime.now(), int(hidden)))
+        # Tokenização feita uma única vez, na ingestão, na mesma transação
+        if not hidden:
+            _increment_token_counts(c, session_id, response)
+        conn.commit()
+
+    try:
+        run_db(op, session_id, create_shard=True)
+        get_responses.clear(session_id)     # write-invalidate apenas desta sessão
+        get_token_counts.clear(session_id)
+        get_hidden_count.clear(session_id)
         return True
     except Exception as e:
         st.error(f"Erro ao adicionar resposta: {e}")
@@ -314,14 +661,21 @@ def end_session(session_id):
     continuam vendo a sessão como ativa mesmo depois de encerrada."""
     def op(conn):
         c = conn.cursor()
-        c.execute("DELETE FROM responses WHERE session_id = ?", (session_id,))
+        if STORAGE_MODE != "sharded":
+            c.execute("DELETE FROM responses WHERE session_id = ?", (session_id,))
+            c.execute("DELETE FROM token_counts WHERE session_id = ?", (session_id,))
         c.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
         conn.commit()
 
     try:
         run_db(op)
-        get_session_by_pin.clear()       # write-invalidate global (PIN sumiu)
-        get_responses.clear(session_id)  # write-invalidate desta sessão
+        if STORAGE_MODE == "sharded":
+            get_shard_pool().drop(session_id)  # respostas e contadores saem com o arquivo
+        _remove_session_exports(session_id)  # exports publicados não sobrevivem à sessão
+        get_session_by_pin.clear()          # write-invalidate global (PIN sumiu)
+        get_responses.clear(session_id)     # write-invalidate desta sessão
+        get_token_counts.clear(session_id)
+        get_hidden_count.clear(session_id)
         return True
     except Exception as e:
         st.error(f"Erro ao encerrar sessão: {e}")
@@ -331,15 +685,52 @@ def end_session(session_id):
 def get_responses(session_id):
     def op(conn):
         c = conn.cursor()
-        c.execute("SELECT response FROM responses WHERE session_id = ? ORDER BY created_at DESC", (session_id,))
+        c.execute("SELECT response FROM responses WHERE session_id = ? AND hidden = 0 "
+                  "ORDER BY created_at DESC", (session_id,))
         return [r[0] for r in c.fetchall() if r[0] and r[0].strip()]
 
     try:
-        return run_db(op)
+        return run_db(op, session_id, missing=[])
     except Exception as e:
         st.error(f"Erro ao buscar respostas: {e}")
         return []
 
+@st.cache_data(ttl=3, show_spinner=False)
+def get_token_counts(session_id):
+    """Palavras mais frequentes da sessão, lidas dos contadores incrementais
+    — nenhuma resposta é re-tokenizada na leitura."""
+    def op(conn):
+        c = conn.cursor()
+        c.execute("SELECT token, count FROM token_counts WHERE session_id = ? "
+                  "ORDER BY count DESC, token", (session_id,))
+        return c.fetchall()
+
+    try:
+        return run_db(op, session_id, missing=[])
+    except Exception as e:
+        st.error(f"Erro ao buscar contagem de palavras: {e}")
+        return []
+
+@st.cache_data(ttl=3, show_spinner=False)
+def get_hidden_count(session_id):
+    """Quantas respostas o filtro de conteúdo ocultou — para o moderador
+    perceber excesso de bloqueio."""
+    def op(conn):
+        c = conn.cursor()
+        c.execute("SELECT COUNT(*) FROM responses WHERE session_id = ? AND hidden = 1", (session_id,))
+        return c.fetchone()[0]
+
+    try:
+        return run_db(op, session_id, missing=0)
+    except Exception as e:
+        st.error(f"Erro ao contar respostas ocultadas: {e}")
+        return 0
+
+
+def phrase_counts(responses):
+    """Contagem por frase inteira (modo "frases"), normalizada como na nuvem."""
+    return Counter(r.upper().strip() for r in responses if r and r.strip()).most_common()
+
 # Paleta categórica validada (todas as cores >= 3:1 de contraste sobre branco)
 WORDCLOUD_PALETTE = [
     "#2a78d6", "#199e70", "#c98500", "#008300",
@@ -394,19 +785,20 @@ def _wordcloud_weights(phrase_counts):
 
 
 @st.cache_data(ttl=300, max_entries=32, show_spinner=False)
-def create_wordcloud(responses):
-    """Gera a nuvem de palavras como PNG (bytes) a partir das respostas.
+def create_wordcloud(counts):
+    """Gera a nuvem de palavras como PNG (bytes) a partir de pares (texto, contagem).
 
+    Recebe contagens já agregadas — frases (phrase_counts) ou palavras
+    (get_token_counts) — ordenadas da mais para a menos frequente.
     O posicionamento usa o algoritmo espiral da lib `wordcloud`, com teste de
     colisão pixel a pixel — nenhuma palavra sobrepõe outra. O tamanho segue a
     frequência, com variação entre empates (ver _wordcloud_weights).
     """
     try:
-        phrases = [r.upper().strip() for r in responses if r and r.strip()]
-        if not phrases:
+        if not counts:
             return None
 
-        weights = _wordcloud_weights(Counter(phrases).most_common(50))
+        weights = _wordcloud_weights(list(counts)[:50])
 
         wc = WordCloud(
             width=1600,
@@ -433,6 +825,149 @@ def create_wordcloud(responses):
         return None
 
 
+# Store de imagens endereçado por conteúdo, servido pelo static serving do
+# Streamlit (.streamlit/config.toml: enableStaticServing). st.image com bytes
+# registra uma URL nova no media manager a cada rerun e todo cliente baixa a
+# imagem de novo; aqui bytes iguais -> mesmo arquivo -> mesma URL.
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+STATIC_ASSET_DIR = os.path.join(STATIC_DIR, "assets")
+STATIC_ASSET_URL = "app/static/assets"
+STATIC_ASSET_MAX_FILES = 256
+STATIC_ASSET_MAX_BYTES = 64 * 1024 * 1024
+
+
+def _evict_static_assets():
+    """Remove as versões menos usadas recentemente até caber nos limites."""
+    entries = []
+    for entry in os.scandir(STATIC_ASSET_DIR):
+        if entry.name.endswith(".png"):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    entries.sort()  # mais antigo primeiro
+
+    total = sum(size for _, size, _ in entries)
+    while entries and (len(entries) > STATIC_ASSET_MAX_FILES or total > STATIC_ASSET_MAX_BYTES):
+        _, size, path = entries.pop(0)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def publish_static_image(png_bytes, prefix):
+    """Grava o PNG no store (se ainda não existir) e devolve sua URL estável.
+
+    O nome é o hash do conteúdo, então a URL só muda quando a imagem muda.
+    O `?v=` faz o handler estático (tornado) responder com Cache-Control de
+    longa duração; o ETag cobre revalidações. O mtime serve de LRU para o
+    despejo: cada uso "toca" o arquivo.
+    """
+    digest = hashlib.sha256(png_bytes).hexdigest()[:20]
+    name = f"{prefix}-{digest}.png"
+    path = os.path.join(STATIC_ASSET_DIR, name)
+    if os.path.exists(path):
+        os.utime(path)
+    else:
+        os.makedirs(STATIC_ASSET_DIR, exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(png_bytes)
+        os.replace(tmp_path, path)  # atômico: cliente nunca vê arquivo pela metade
+        _evict_static_assets()
+    return f"{STATIC_ASSET_URL}/{name}?v={digest}"
+
+
+def static_serving_enabled():
+    """O config.toml só vale quando o Streamlit é iniciado a partir da pasta
+    do app; de outro diretório, /app/static responde 404."""
+    return bool(st.get_option("server.enableStaticServing"))
+
+
+def show_image(png_bytes, prefix, alt, width=None):
+    """Exibe um PNG pela URL do store estático; sem static serving ou se o
+    disco falhar, usa st.image."""
+    try:
+        if not static_serving_enabled():
+            raise OSError("static serving desabilitado")
+        url = publish_static_image(png_bytes, prefix)
+    except OSError:
+        if width:
+            st.image(png_bytes, width=width)
+        else:
+            st.image(png_bytes, use_container_width=True)
+        return
+    style = f"width: {width}px;" if width else "width: 100%;"
+    st.markdown(f'<img src="{url}" alt="{html.escape(alt)}" style="{style}">',
+                unsafe_allow_html=True)
+
+
+# Exportações: st.download_button guarda o arquivo inteiro em memória, então
+# o export é escrito em disco bloco a bloco (export_results) e baixado pelo
+# static serving, que envia o arquivo em streaming. Limite: o handler estático
+# do Streamlit responde 404 para arquivos acima de 200 MB
+# (MAX_APP_STATIC_FILE_SIZE); exports maiores são descartados com um aviso
+# para usar a linha de comando (python export_results.py), que não tem limite.
+# A URL não exige login: o token aleatório no caminho a torna inadivinhável,
+# os arquivos expiram após EXPORT_TTL_SECONDS (varredura a cada rerun) e
+# somem junto com a sessão no end_session.
+EXPORT_DIR = os.path.join(STATIC_DIR, "exports")
+EXPORT_URL = "app/static/exports"
+EXPORT_TTL_SECONDS = 15 * 60
+EXPORT_MAX_BYTES = 200 * 1024 * 1024
+EXPORT_LABELS = {
+    "responses": "Respostas",
+    "counts": "Contagem por resposta",
+    "words": "Contagem por palavra",
+}
+
+
+def _purge_old_exports():
+    """Apaga exports expirados (static/exports/<sessão>/<token>/arquivo)."""
+    if not os.path.isdir(EXPORT_DIR):
+        return
+    cutoff = time.time() - EXPORT_TTL_SECONDS
+    for session_entry in os.scandir(EXPORT_DIR):
+        if not session_entry.is_dir():
+            continue
+        for entry in os.scandir(session_entry.path):
+            if entry.is_dir() and entry.stat().st_mtime < cutoff:
+                shutil.rmtree(entry.path, ignore_errors=True)
+        try:
+            os.rmdir(session_entry.path)  # só sai se ficou vazio
+        except OSError:
+            pass
+
+
+def _remove_session_exports(session_id):
+    shutil.rmtree(os.path.join(EXPORT_DIR, str(uuid.UUID(session_id))), ignore_errors=True)
+
+
+def create_export(session_id, pin, kind, fmt):
+    """Exporta a sessão para um arquivo temporário servido estaticamente.
+
+    Retorna (url, nome do arquivo, caminho). A leitura usa conexão própria em
+    modo somente leitura: o db_lock não é tomado e as respostas seguem
+    chegando. Levanta RuntimeError se o arquivo passar de EXPORT_MAX_BYTES.
+    """
+    _purge_old_exports()
+    session_dir = str(uuid.UUID(session_id))
+    token = uuid.uuid4().hex
+    directory = os.path.join(EXPORT_DIR, session_dir, token)
+    os.makedirs(directory)
+    name = f"app-live-{pin}-{kind}.{fmt}"
+    path = os.path.join(directory, name)
+    db_path = responses_db_path(session_id, STORAGE_MODE, DB_PATH, SHARD_DIR)
+    export_session(db_path, session_id, kind, fmt, path)
+    if os.path.getsize(path) > EXPORT_MAX_BYTES:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise RuntimeError(
+            f"o arquivo passou de {EXPORT_MAX_BYTES // (1024 * 1024)} MB, o limite de download "
+            f"do app. Use a linha de comando: python export_results.py --pin {pin} "
+            f"--storage {STORAGE_MODE} --kind {kind} --format {fmt} -o {name}")
+    return f"{EXPORT_URL}/{session_dir}/{token}/{name}", name, path
+
+
 def render_moderator_auth(form_key, info_text):
     """Formulário de autenticação do moderador (compartilhado pelos modos criar/moderar)."""
     st.header("🔐 Autenticação de Moderador")
@@ -453,6 +988,7 @@ def render_moderator_auth(form_key, info_text):
 
 # Inicializar banco
 init_db()
+_purge_old_exports()  # a cada rerun: exports expirados não esperam o próximo export
 
 # Estados da sessão
 if 'session_mode' not in st.session_state:
@@ -467,6 +1003,8 @@ if 'moderator_authenticated' not in st.session_state:
     st.session_state.moderator_authenticated = False
 if 'show_change_password' not in st.session_state:
     st.session_state.show_change_password = False
+if 'show_content_filter' not in st.session_state:
+    st.session_state.show_content_filter = False
 
 # Verificar se PIN foi passado via URL
 query_params = st.query_params
@@ -539,12 +1077,17 @@ if st.session_state.session_mode == 'participate':
                 submitted = st.form_submit_button("📤 Enviar Resposta")
                 
                 if submitted and response.strip():
-                    if add_response(session_data[0], response.strip()):
-                        st.success("✅ Resposta enviada com sucesso! Obrigado pela sua participação!")
-                        time.sleep(1)
-                        st.rerun()
+                    try:
+                        added = add_response(session_data[0], response.strip())
+                    except ResponseRejected:
+                        st.warning("⚠️ Sua resposta contém termos não permitidos nesta sessão.")
                     else:
-                        st.error("❌ Erro ao enviar resposta. Tente novamente.")
+                        if added:
+                            st.success("✅ Resposta enviada com sucesso! Obrigado pela sua participação!")
+                            time.sleep(1)
+                            st.rerun()
+                        else:
+                            st.error("❌ Erro ao enviar resposta. Tente novamente.")
                 elif submitted:
                     st.warning("⚠️ Por favor, digite uma resposta válida.")
             
@@ -555,9 +1098,9 @@ if st.session_state.session_mode == 'participate':
                 
                 # Mostrar nuvem de palavras para participantes
                 st.subheader("☁️ Nuvem de Palavras das Respostas")
-                wordcloud_png = create_wordcloud(current_responses)
+                wordcloud_png = create_wordcloud(session_cloud_counts(session_data, current_responses))
                 if wordcloud_png:
-                    st.image(wordcloud_png, use_container_width=True)
+                    show_image(wordcloud_png, "wordcloud", "Nuvem de palavras")
                 else:
                     st.info("Aguardando mais respostas para gerar a nuvem de palavras...")
                     
@@ -614,6 +1157,31 @@ elif st.session_state.session_mode == 'create':
                         st.error("❌ Senha atual incorreta!")
             st.markdown("---")
         
+        # Botão para configurar o filtro de conteúdo
+        if st.button("🛡️ Filtro de Conteúdo"):
+            st.session_state.show_content_filter = not st.session_state.show_content_filter
+        
+        if st.session_state.show_content_filter:
+            blocklist, allowlist, filter_action = get_content_filter_settings()
+            with st.form("content_filter_form"):
+                st.subheader("🛡️ Filtro de Conteúdo")
+                st.caption("Um termo por linha (palavras ou expressões inteiras; acentos e "
+                           "maiúsculas são ignorados). Vale para todas as sessões.")
+                new_blocklist = st.text_area("Termos bloqueados:", value=blocklist, height=150)
+                new_allowlist = st.text_area("Exceções (liberam expressões que contêm um termo bloqueado):",
+                                             value=allowlist, height=80)
+                new_action = st.radio("Respostas com termos bloqueados:", list(CONTENT_FILTER_ACTIONS),
+                                      index=list(CONTENT_FILTER_ACTIONS).index(filter_action),
+                                      format_func=CONTENT_FILTER_ACTIONS.get)
+                filter_submit = st.form_submit_button("💾 Salvar Filtro")
+                
+                if filter_submit:
+                    if update_content_filter(new_blocklist, new_allowlist, new_action):
+                        st.success(f"✅ Filtro salvo: {len(parse_terms(new_blocklist))} termos bloqueados.")
+                    else:
+                        st.error("❌ Erro ao salvar filtro.")
+            st.markdown("---")
+        
         with st.form("create_session_form"):
             question = st.text_input(
                 "📝 Digite sua pergunta:", 
@@ -658,6 +1226,7 @@ elif st.session_state.session_mode == 'moderate':
                     return
 
                 responses = get_responses(st.session_state.current_session)
+                hidden_count = get_hidden_count(st.session_state.current_session)
                 
                 # Layout principal
                 col1, col2 = st.columns([3, 1])
@@ -669,14 +1238,17 @@ elif st.session_state.session_mode == 'moderate':
                         <div class="participants-count">👥 {len(responses)} participantes</div>
                     </div>
                     """, unsafe_allow_html=True)
+                    if hidden_count:
+                        st.caption(f"🙈 {hidden_count} resposta(s) ocultada(s) pelo filtro de conteúdo "
+                                   "— veja quais na exportação de Respostas (coluna hidden).")
                     
                     # QR Code
                     st.subheader("📱 QR Code")
                     base_url = "https://applive.streamlit.app"
                     current_url = f"{base_url}?pin={st.session_state.current_pin}"
-                    qr_buf = generate_qr_code(current_url)
-                    if qr_buf:
-                        st.image(qr_buf, width=200)
+                    qr_png = generate_qr_code(current_url)
+                    if qr_png:
+                        show_image(qr_png, "qr", "QR Code da sessão", width=200)
                     
                     st.markdown("**🔗 Link:**")
                     st.code(current_url, language=None)
@@ -689,8 +1261,36 @@ elif st.session_state.session_mode == 'moderate':
                         end_session(st.session_state.current_session)
                         st.session_state.current_session = None
                         st.session_state.current_pin = None
+                        st.session_state.export_link = None
                         st.session_state.pending_mode = "🎯 Criar Sessão"
                         st.rerun(scope="app")
+
+                    # Exportação dos resultados
+                    with st.expander("📥 Exportar"):
+                        if not static_serving_enabled():
+                            # Sem static serving o link de download daria 404
+                            st.error("❌ Download indisponível: o static serving está desligado "
+                                     "(rode `streamlit run` de dentro da pasta do app). Use a linha "
+                                     f"de comando: python export_results.py --pin {st.session_state.current_pin} "
+                                     f"--storage {STORAGE_MODE}")
+                        else:
+                            export_kind = st.selectbox("Conteúdo:", list(EXPORT_LABELS),
+                                                       format_func=EXPORT_LABELS.get, key="export_kind")
+                            export_format = st.radio("Formato:", ["csv", "parquet"], horizontal=True,
+                                                     format_func=str.upper, key="export_format")
+                            if st.button("📦 Gerar arquivo"):
+                                with st.spinner("Exportando..."):
+                                    try:
+                                        st.session_state.export_link = create_export(
+                                            st.session_state.current_session, st.session_state.current_pin,
+                                            export_kind, export_format)
+                                    except Exception as e:
+                                        st.error(f"Erro ao exportar: {e}")
+                            export_link = st.session_state.get('export_link')
+                            if export_link and os.path.exists(export_link[2]):  # some ao expirar
+                                export_url, export_name, _ = export_link
+                                st.markdown(f'<a href="{export_url}" download="{html.escape(export_name)}">'
+                                            f'⬇️ Baixar {html.escape(export_name)}</a>', unsafe_allow_html=True)
                 
                 with col1:
                     st.markdown(f"""
@@ -700,18 +1300,37 @@ elif st.session_state.session_mode == 'moderate':
                     """, unsafe_allow_html=True)
                     
                     if responses:
-                        # Processar respostas
-                        response_counts = Counter(responses)
+                        # Frases inteiras ou palavras soltas (perguntas abertas,
+                        # onde toda frase é única). O modo palavras lê os
+                        # contadores mantidos na ingestão, sem reprocessar respostas.
+                        # Fica gravado na sessão: a nuvem dos participantes segue o moderador.
+                        analysis_mode = st.radio("🔤 Analisar por:", list(ANALYSIS_MODES),
+                                                 index=list(ANALYSIS_MODES).index(session_data[4]),
+                                                 format_func=ANALYSIS_MODES.get, horizontal=True)
+                        if analysis_mode != session_data[4]:
+                            update_analysis_mode(session_data[0], analysis_mode)
+                        if analysis_mode == "words":
+                            ranked_counts = get_token_counts(st.session_state.current_session)
+                            cloud_counts = ranked_counts
+                            unique_label = "🔢 Palavras Distintas"
+                            chart_title = "📈 Palavras Mais Frequentes"
+                            list_title = "### 📝 Todas as Palavras"
+                        else:
+                            ranked_counts = Counter(responses).most_common()
+                            cloud_counts = phrase_counts(responses)
+                            unique_label = "🔢 Respostas Únicas"
+                            chart_title = "📈 Respostas Mais Frequentes"
+                            list_title = "### 📝 Todas as Respostas"
                         
                         # Métricas
                         col_m1, col_m2, col_m3 = st.columns(3)
                         with col_m1:
                             st.metric("📊 Total de Respostas", len(responses))
                         with col_m2:
-                            st.metric("🔢 Respostas Únicas", len(response_counts))
+                            st.metric(unique_label, len(ranked_counts))
                         with col_m3:
-                            if response_counts:
-                                most_common = response_counts.most_common(1)[0]
+                            if ranked_counts:
+                                most_common = ranked_counts[0]
                                 st.metric("🥇 Mais Popular", f"{most_common[0]} ({most_common[1]}x)")
                         
                         # Tabs para visualizações
@@ -719,7 +1338,7 @@ elif st.session_state.session_mode == 'moderate':
                         
                         with tab1:
                             # Gráfico de barras
-                            df_responses = pd.DataFrame(list(response_counts.items()), 
+                            df_responses = pd.DataFrame(ranked_counts, 
                                                       columns=['Resposta', 'Quantidade'])
                             df_responses = df_responses.sort_values('Quantidade', ascending=False).head(15)
                             
@@ -730,7 +1349,7 @@ elif st.session_state.session_mode == 'moderate':
                                     y='Quantidade',
                                     color='Quantidade', 
                                     color_continuous_scale='viridis',
-                                    title="📈 Respostas Mais Frequentes"
+                                    title=chart_title
                                 )
                                 fig.update_layout(
                                     height=400,
@@ -741,16 +1360,16 @@ elif st.session_state.session_mode == 'moderate':
                         
                         with tab2:
                             # Nuvem de palavras
-                            wordcloud_png = create_wordcloud(responses)
+                            wordcloud_png = create_wordcloud(cloud_counts)
                             if wordcloud_png:
-                                st.image(wordcloud_png, use_container_width=True)
+                                show_image(wordcloud_png, "wordcloud", "Nuvem de palavras")
                             else:
                                 st.info("💭 Aguardando mais respostas para gerar a nuvem de palavras...")
                         
                         with tab3:
                             # Lista de respostas
-                            st.markdown("### 📝 Todas as Respostas")
-                            for i, (response, count) in enumerate(response_counts.most_common(), 1):
+                            st.markdown(list_title)
+                            for i, (response, count) in enumerate(ranked_counts, 1):
                                 st.markdown(f"**{i}.** {response} `({count}x)`")
                     else:
                         st.info("📭 Aguardando respostas dos participantes...")
@@ -0,0 +1,149 @@
+"""Filtro de conteúdo das respostas: blocklist/allowlist num autômato Aho-Corasick.
+
+Os termos são compilados uma vez num único autômato; checar uma resposta
+custa O(tamanho do texto + ocorrências), independente de a blocklist ter 10
+ou 10 mil termos — por isso o filtro roda na ingestão (add_response) e não
+a cada renderização.
+
+Texto e termos são normalizados (minúsculas, sem acento, pontuação vira
+espaço) e os termos casam só com palavras inteiras: "pau" bloqueia "PAU!",
+mas não "paulo". Termos da allowlist que contêm um termo bloqueado o liberam
+naquele trecho (ex.: blocklist "pau", allowlist "pau brasil").
+
+Benchmark:  python content_filter.py
+"""
+import re
+import unicodedata
+from collections import deque
+
+_NON_WORD_RE = re.compile(r"[\W_]+")
+
+
+def normalize(text):
+    """Minúsculas, sem acento, palavras separadas por um espaço e com espaço
+    nas pontas — assim " termo " só casa com a palavra inteira."""
+    text = "".join(ch for ch in unicodedata.normalize("NFD", text.lower())
+                   if unicodedata.category(ch) != "Mn")
+    return f" {_NON_WORD_RE.sub(' ', text).strip()} "
+
+
+def parse_terms(text):
+    """Um termo por linha; linhas vazias e comentários (#) são ignorados."""
+    terms = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line and not line.startswith("#"):
+            terms.append(line)
+    return terms
+
+
+class ContentFilter:
+    """Autômato Aho-Corasick com os termos da blocklist e da allowlist."""
+
+    def __init__(self, blocklist, allowlist=()):
+        self._goto = [{}]       # estado -> {caractere: próximo estado}
+        self._fail = [0]
+        self._out = [[]]        # estado -> [(tamanho do padrão, é allowlist?)]
+        self.block_count = 0
+
+        seen = set()
+        for terms, allowed in ((blocklist, False), (allowlist, True)):
+            for term in terms:
+                pattern = normalize(term)
+                if pattern.strip() and (pattern, allowed) not in seen:
+                    seen.add((pattern, allowed))
+                    self._add(pattern, allowed)
+                    self.block_count += not allowed
+        self._build_failure_links()
+
+    def __bool__(self):
+        return self.block_count > 0
+
+    def _add(self, pattern, allowed):
+        state = 0
+        for ch in pattern:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append((len(pattern), allowed))
+
+    def _build_failure_links(self):
+        # BFS: o link de falha de cada estado aponta para o maior sufixo
+        # próprio que também é prefixo de algum padrão; as saídas desse
+        # sufixo são herdadas, para a busca não precisar percorrer a cadeia.
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def _matches(self, text):
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for end, ch in enumerate(normalize(text), 1):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for length, allowed in out[state]:
+                yield end - length, end, allowed
+
+    def is_blocked(self, text):
+        """True se o texto contém algum termo bloqueado fora de um termo liberado."""
+        if not self:
+            return False
+        blocked, allowed = [], []
+        for start, end, is_allowed in self._matches(text):
+            (allowed if is_allowed else blocked).append((start, end))
+        return any(not any(a_start <= start and end <= a_end for a_start, a_end in allowed)
+                   for start, end in blocked)
+
+
+def _benchmark(n_terms=10_000, n_texts=50_000):
+    import random
+    import string
+    import time
+
+    rng = random.Random(42)
+
+    def word():
+        return "".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 10)))
+
+    blocklist = [word() for _ in range(n_terms)]
+    vocabulary = [word() for _ in range(5_000)] + blocklist[:50]
+    texts = [" ".join(rng.choices(vocabulary, k=rng.randint(1, 12))) for _ in range(n_texts)]
+
+    t0 = time.perf_counter()
+    content_filter = ContentFilter(blocklist, allowlist=["pau brasil"])
+    t1 = time.perf_counter()
+    hits = sum(content_filter.is_blocked(t) for t in texts)
+    t2 = time.perf_counter()
+    chars = sum(len(t) for t in texts)
+
+    # Referência: o laço ingênuo (cada termo testado contra cada resposta)
+    sample = texts[:500]
+    t3 = time.perf_counter()
+    for t in sample:
+        padded = normalize(t)
+        any(f" {term} " in padded for term in blocklist)
+    t4 = time.perf_counter()
+
+    print(f"blocklist: {n_terms} termos, compilada em {(t1 - t0) * 1000:.0f} ms "
+          f"({len(content_filter._goto)} estados)")
+    print(f"aho-corasick: {n_texts / (t2 - t1):,.0f} respostas/s "
+          f"({chars / (t2 - t1) / 1e6:.1f} M caracteres/s), {hits} bloqueadas")
+    print(f"laço ingênuo: {len(sample) / (t4 - t3):,.0f} respostas/s")
+
+
+if __name__ == "__main__":
+    _benchmark()
@@ -0,0 +1,214 @@
+"""Exportação em streaming dos resultados de uma sessão (CSV ou Parquet).
+
+Usado pelo painel do moderador (app.py) e direto pela linha de comando:
+
+    python export_results.py --pin 123456 --kind responses -o respostas.csv
+    python export_results.py --pin 123456 --kind counts --format parquet -o contagens.parquet
+
+As linhas saem do SQLite em blocos (`fetchmany`) por uma conexão somente
+leitura própria — o snapshot do WAL garante consistência sem o `db_lock` do
+app — e são escritas bloco a bloco: a memória fica constante, seja a sessão
+de 200 ou de 500 mil respostas. Não importa Streamlit.
+"""
+import argparse
+import csv
+import io
+import os
+import sqlite3
+import sys
+import uuid
+
+CHUNK_SIZE = 5000
+
+# tipo -> (colunas como (nome, tipo), consulta). A ordem por rowid segue a
+# ordem de chegada sem exigir ordenação da sessão inteira. As respostas
+# brutas levam a marca do filtro de conteúdo; as contagens, como no app,
+# ignoram respostas ocultadas.
+EXPORT_KINDS = {
+    "responses": ((("response", "string"), ("created_at", "string"), ("hidden", "int64")),
+                  "SELECT response, created_at, hidden FROM responses WHERE session_id = ? ORDER BY rowid"),
+    "counts": ((("response", "string"), ("count", "int64")),
+               "SELECT response, COUNT(*) FROM responses WHERE session_id = ? AND hidden = 0 "
+               "GROUP BY response ORDER BY COUNT(*) DESC, response"),
+    "words": ((("token", "string"), ("count", "int64")),
+              "SELECT token, count FROM token_counts WHERE session_id = ? ORDER BY count DESC, token"),
+}
+
+EXPORT_FORMATS = ("csv", "parquet")
+
+# Células que o Excel/LibreOffice interpretam como fórmula (CSV injection)
+_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def responses_db_path(session_id, storage_mode="single", db_path="app_live.db",
+                      shard_dir="app_live_shards"):
+    """Arquivo que guarda as respostas da sessão conforme o modo de
+    armazenamento (APP_LIVE_STORAGE). No modo "sharded", None se a sessão
+    ainda não tem shard (nenhuma resposta gravada)."""
+    if storage_mode != "sharded":
+        return db_path
+    shard_path = os.path.join(shard_dir, f"{uuid.UUID(session_id)}.db")
+    return shard_path if os.path.exists(shard_path) else None
+
+
+def _connect_readonly(db_path):
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=30)
+    conn.execute("PRAGMA busy_timeout=30000;")
+    return conn
+
+
+def iter_chunks(db_path, session_id, kind, chunk_size=CHUNK_SIZE):
+    """Gera listas de até `chunk_size` linhas do tipo de exportação pedido.
+
+    `db_path` None (shard inexistente) gera nada: sessão sem respostas.
+    """
+    if db_path is None:
+        return
+    _, query = EXPORT_KINDS[kind]
+    conn = _connect_readonly(db_path)
+    try:
+        cursor = conn.execute(query, (session_id,))
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        conn.close()
+
+
+def _escape_formula(value):
+    """Prefixa com ' textos que a planilha executaria como fórmula
+    (ex.: "=HYPERLINK(...)" enviado por um participante)."""
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def iter_csv(chunks, columns):
+    """Converte blocos de linhas em pedaços de CSV (bytes, UTF-8 com BOM
+    para o Excel reconhecer a acentuação). Respostas vêm de participantes
+    anônimos, então células com cara de fórmula são escapadas."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow([name for name, _ in columns])
+    yield ("\ufeff" + buf.getvalue()).encode("utf-8")
+    for rows in chunks:
+        buf.seek(0)
+        buf.truncate()
+        writer.writerows([_escape_formula(v) for v in row] for row in rows)
+        yield buf.getvalue().encode("utf-8")
+
+
+def write_parquet(chunks, columns, dest):
+    """Escreve os blocos como row groups de um Parquet em `dest` (caminho ou arquivo)."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError("Exportação Parquet requer o pacote pyarrow") from e
+
+    # created_at é gravado pelo sqlite3 como texto ISO
+    schema = pa.schema([(name, getattr(pa, type_name)()) for name, type_name in columns])
+    with pq.ParquetWriter(dest, schema) as writer:
+        for rows in chunks:
+            writer.write_table(pa.table([list(col) for col in zip(*rows)], schema=schema))
+
+
+def export_session(db_path, session_id, kind, fmt, dest, chunk_size=CHUNK_SIZE):
+    """Exporta a sessão para `dest` (caminho ou arquivo binário aberto)."""
+    if kind not in EXPORT_KINDS:
+        raise ValueError(f"Tipo de exportação inválido: {kind}")
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Formato de exportação inválido: {fmt}")
+
+    columns, _ = EXPORT_KINDS[kind]
+    chunks = iter_chunks(db_path, session_id, kind, chunk_size)
+    if fmt == "parquet":
+        write_parquet(chunks, columns, dest)
+        return
+
+    if isinstance(dest, (str, os.PathLike)):
+        with open(dest, "wb") as f:
+            for piece in iter_csv(chunks, columns):
+                f.write(piece)
+    else:
+        for piece in iter_csv(chunks, columns):
+            dest.write(piece)
+
+
+def find_session_id(db_path, pin=None, session_id=None):
+    """ID da sessão no catálogo, pelo PIN ou pelo próprio ID; None se não existir."""
+    conn = _connect_readonly(db_path)
+    try:
+        if pin is not None:
+            row = conn.execute("SELECT id FROM sessions WHERE pin = ?", (pin,)).fetchone()
+        else:
+            row = conn.execute("SELECT id FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return row[0] if row else None
+    finally:
+        conn.close()
+
+
+def _has_responses(db_path, session_id):
+    conn = _connect_readonly(db_path)
+    try:
+        row = conn.execute("SELECT 1 FROM responses WHERE session_id = ? LIMIT 1", (session_id,)).fetchone()
+        return row is not None
+    finally:
+        conn.close()
+
+
+def check_storage_mode(session_id, storage_mode, db_path, shard_dir):
+    """Mensagem de erro se as respostas da sessão estão no outro modo de
+    armazenamento — sem isso, um --storage errado exporta só o cabeçalho."""
+    shard_exists = os.path.exists(os.path.join(shard_dir, f"{uuid.UUID(session_id)}.db"))
+    if storage_mode == "single" and shard_exists and not _has_responses(db_path, session_id):
+        return "as respostas desta sessão estão num shard; use --storage sharded"
+    if storage_mode == "sharded" and not shard_exists and _has_responses(db_path, session_id):
+        return "as respostas desta sessão estão no banco principal; use --storage single"
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exporta os resultados de uma sessão do App Live.")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--pin", help="PIN da sessão")
+    target.add_argument("--session-id", help="ID (UUID) da sessão")
+    parser.add_argument("--kind", choices=sorted(EXPORT_KINDS), default="responses",
+                        help="respostas brutas, contagem por resposta ou contagem por palavra")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv", dest="fmt")
+    parser.add_argument("-o", "--output", help="arquivo de saída (padrão: stdout, só CSV)")
+    parser.add_argument("--db", default="app_live.db", help="banco principal/catálogo")
+    parser.add_argument("--storage", choices=("single", "sharded"),
+                        default=os.environ.get("APP_LIVE_STORAGE", "single").strip().lower(),
+                        help="modo de armazenamento do app (padrão: APP_LIVE_STORAGE ou single)")
+    parser.add_argument("--shard-dir", default=os.environ.get("APP_LIVE_SHARD_DIR", "app_live_shards"),
+                        help="diretório dos shards (modo APP_LIVE_STORAGE=sharded)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    if args.session_id is not None:
+        try:
+            args.session_id = str(uuid.UUID(args.session_id))
+        except ValueError:
+            parser.error(f"ID de sessão inválido: {args.session_id}")
+    session_id = find_session_id(args.db, pin=args.pin, session_id=args.session_id)
+    if not session_id:
+        if args.pin is not None:
+            parser.error(f"sessão com PIN {args.pin} não encontrada")
+        parser.error(f"sessão {args.session_id} não encontrada")
+    if args.fmt == "parquet" and not args.output:
+        parser.error("Parquet precisa de --output")
+
+    mismatch = check_storage_mode(session_id, args.storage, args.db, args.shard_dir)
+    if mismatch:
+        parser.error(mismatch)
+
+    db_path = responses_db_path(session_id, args.storage, args.db, args.shard_dir)
+    export_session(db_path, session_id, args.kind, args.fmt,
+                   args.output or sys.stdout.buffer, args.chunk_size)
+
+
+if __name__ == "__main__":
+    main()